@@ -7,6 +7,7 @@ import time
 from mpmath import polylog
 from scipy.interpolate import UnivariateSpline
 import os
+import tempfile
 import pkg_resources
 
 
@@ -25,15 +26,62 @@ def f(r):
 #fsinterp = np.array([f(r) for r in rsinterp])
 #np.savetxt('./bz_fr_data.dat', np.vstack((rsinterp,fsinterp)).T)
 
+def load_fr_table(datafile):
+    """load the pre-saved (r, f(r)) table, a (2, N) text file
+       the parsed table is cached as a .npy file alongside and memory-mapped on later imports
+    """
+    npyfile = datafile + '.npy'
+    if os.path.exists(npyfile) and os.path.getmtime(npyfile) >= os.path.getmtime(datafile):
+        try:
+            return np.load(npyfile, mmap_mode='r')
+        except (OSError, ValueError): # unreadable or truncated cache, reparse and rewrite it
+            pass
+
+    # np.fromfile parses in C, much faster than np.loadtxt for one long row per quantity
+    data = np.fromfile(datafile, sep=' ').reshape(2, -1)
+
+    # write to a temporary file and rename, so concurrent imports never see a partial cache
+    try:
+        (fd, tmpfile) = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(npyfile))
+    except OSError: # read-only install, parse again next time
+        return data
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            np.save(fh, data)
+        os.chmod(tmpfile, 0o644) # mkstemp makes the file private
+        os.replace(tmpfile, npyfile)
+    except OSError:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+    return data
+
 # get f(r) from pre-saved data
-datafile = pkg_resources.resource_stream(__name__, 'bz_fr_data.dat')
-(rsinterp,fsinterp) = np.loadtxt(datafile)
+(rsinterp,fsinterp) = load_fr_table(pkg_resources.resource_filename(__name__, 'bz_fr_data.dat'))
 NINTERP = len(rsinterp)
 RMAXINTERP = np.max(rsinterp)
 
-# interpolate f(r) and get its derivative
-fi = UnivariateSpline(rsinterp, fsinterp, k=1,s=0, ext=0)
-fiprime = fi.derivative()
+# the saved table is on a uniform grid, so lookups can skip the bisection
+R0INTERP = rsinterp[0]
+DRINTERP = rsinterp[1] - rsinterp[0]
+UNIFORMINTERP = np.allclose(np.diff(rsinterp), DRINTERP)
+
+# linear interpolation table for f(r) and its derivative
+# rows are (r, f, df/dr) at the left edge of each interval, so f and f' share one lookup
+FRTABLE = np.vstack((rsinterp[:-1], fsinterp[:-1], np.diff(fsinterp)/np.diff(rsinterp)))
+
+def fr_interp(r):
+    """linearly interpolate f(r) and its derivative from the tabulated data"""
+    if UNIFORMINTERP:
+        idx = np.floor((r - R0INTERP)/DRINTERP).astype(np.intp).clip(0, NINTERP-2)
+        # the floor can be off by one next to a knot, correct it so r on a knot
+        # takes the interval to its right, the same as the searchsorted branch
+        idx = idx - ((idx > 0) & (rsinterp[idx] > r))
+        idx = idx + ((idx < NINTERP-2) & (rsinterp[idx+1] <= r))
+    else:
+        idx = np.searchsorted(rsinterp, r, side='right').clip(1, NINTERP-1) - 1
+    (r_lo, f_lo, frp) = FRTABLE[:, idx]
+    fr = f_lo + (r - r_lo)*frp
+    return (np.asarray(fr), np.asarray(frp)) # 0-d arrays rather than scalars, callers assign into them
 
 class Bfield(object):
     """ object for b-field as a function of r, only in equatorial plane for now """
@@ -467,9 +515,8 @@ def Bfield_BZmonopole(a, r, th, C=1, secondorder_only=False):
     Sigma = r2 + a2*cth2
     gdet = sth*Sigma
     
-    fr = fi(r)
+    (fr, frp) = fr_interp(r)
     fr[r>RMAXINTERP] = 1./(4.*r[r>RMAXINTERP])
-    frp = fiprime(r)
     frp[r>RMAXINTERP] = -1./(4.*r2[r>RMAXINTERP])
     
     phi = C*(1 - cth) + C*a2*fr*sth2*cth    
@@ -9,6 +9,9 @@ import time
 from mpmath import polylog
 from scipy.interpolate import UnivariateSpline
 import os
+import math
+from functools import lru_cache
+from numba import njit, prange
 
 # simulation fit factors
 ELLISCO =1.; VRISCO = 2;
@@ -21,6 +24,117 @@ CHI = -150*np.pi/180.
 # default b field for drift frame
 BFIELD_DEFAULT = Bfield('bz_para')
 
+# default output dtype, float32 r gives float32 output from the equatorial models
+DTYPE = np.float64
+
+# fastmath flags for numba kernels
+# nnan/ninf are left off so nan/inf at r=0 or inside the horizon propagate as in numpy
+FASTMATH = {'nsz', 'arcp', 'contract', 'reassoc'}
+
+@lru_cache(maxsize=128)
+def _isco_radius(a, s):
+    """isco radius for spin a, prograde (s=1) or retrograde (s=-1), cached per spin"""
+    z1 = 1 + np.cbrt(1-a**2)*(np.cbrt(1+a) + np.cbrt(1-a))
+    z2 = np.sqrt(3*a**2 + z1**2)
+    ri = 3 + z2 - s*np.sqrt((3-z1)*(3+z1+2*z2))
+    return float(ri)
+
+def _isco_conserved(a, s, ri, fac_subkep=1):
+    """(sub) keplerian angular momentum and energy at the isco, carried inside it"""
+    spin = np.abs(a)
+    asign = np.sign(a)
+    Delta_i = (ri**2 - 2*ri + a**2)
+    Xi_i = (ri**2 + a**2)**2 - Delta_i*a**2
+
+    ell_i = asign*s * (ri**2  + spin**2 - s*2*spin*np.sqrt(ri))/(ri**1.5 - 2*np.sqrt(ri) + s*spin)
+    ell_i *= fac_subkep
+    gam_i = np.sqrt(Delta_i/(Xi_i/ri**2 - 4*a*ell_i/ri - (1-2/ri)*ell_i**2))
+    return (float(ell_i), float(gam_i))
+
+def _isco_params(avals, s, fac_subkep=1):
+    """isco radius and conserved quantities (ri, ell_i, gam_i) for each spin in avals"""
+    params = np.empty((3, len(avals)))
+    for j, a in enumerate(avals):
+        ri = _isco_radius(a, s)
+        params[:, j] = (ri,) + _isco_conserved(a, s, ri, fac_subkep)
+    return params
+
+def _spin_grid(a):
+    """return spins as a flat float array and the shape they add in front of r.shape
+       a float is a single spin and adds no dimensions,
+       an array of spins gives output over a.shape + r.shape in one call
+    """
+    if np.ndim(a)==0 and not isinstance(a, np.ndarray):
+        if not (isinstance(a,float) and (0<=np.abs(a)<1)):
+            raise Exception("|a| should be a float in range [0,1)")
+        return (np.array([a]), ())
+
+    a = np.asarray(a, dtype=float)
+    if not np.all(np.abs(a)<1):
+        raise Exception("|a| should be in range [0,1)")
+    return (a.ravel(), a.shape)
+
+def _ucon_buffer(shape, out=None, dtype=None):
+    """return a (4,)+shape buffer for the contravariant velocity with u2 set to zero
+       the equatorial models fill the other rows in place and return the buffer,
+       which unpacks into (u0, u1, u2, u3) like a tuple
+       the buffer is float32 only if dtype (that of r) is float32, else DTYPE;
+       the kernels still compute in float64 and round on store
+    """
+    if out is None:
+        dtype = np.float32 if dtype == np.float32 else DTYPE
+        out = np.empty((4,) + shape, dtype=dtype)
+    elif out.shape != (4,) + shape or not out.flags.c_contiguous:
+        raise Exception("out should be a C-contiguous array of shape %s"%str((4,) + shape))
+    elif out.dtype not in (np.float32, np.float64):
+        raise Exception("out should have dtype float32 or float64")
+    out[2] = 0
+    return out
+
+@njit(fastmath=FASTMATH, error_model='numpy', cache=True, inline='always')
+def _metric_eq(a, r):
+    """equatorial kerr metric at a single radius, for use inside the numba kernels
+       returns (Delta, Sigma, Xi, g00, g11, g22, g33, g03)
+    """
+    a2 = a*a
+    r2 = r*r
+    Delta = r2 - 2*r + a2
+    Sigma = r2
+    Xi = (r2 + a2)*(r2 + a2) - Delta*a2
+
+    g00 = -(1 - 2/r)
+    g11 = Sigma/Delta
+    g22 = Sigma
+    g33 = r2 + a2 + 2*a2/r
+    g03 = -2*a/r
+    return (Delta, Sigma, Xi, g00, g11, g22, g33, g03)
+
+def _metric_general(a, r, th):
+    """kerr metric at arbitrary theta, numpy broadcasting over r and th
+       returns (sth, Delta, Sigma, Xi, g00, g11, g22, g33, g03)
+    """
+    a2 = a*a
+    r2 = r*r
+    if np.ndim(th)==0: # scalar th, skip the ufunc dispatch
+        cth = math.cos(th)
+        sth = math.sin(th)
+    else:
+        cth = np.cos(th)
+        sth = np.sin(th)
+    cth2 = cth*cth
+    sth2 = sth*sth
+
+    Delta = r2 - 2*r + a2
+    Sigma = r2 + a2*cth2
+    Xi = (r2 + a2)*(r2 + a2) - Delta*a2*sth2
+
+    g00 = -(1 - 2*r/Sigma)
+    g11 = Sigma/Delta
+    g22 = Sigma
+    g33 = Xi*sth2/Sigma
+    g03 = -2*r*a*sth2/Sigma
+    return (sth, Delta, Sigma, Xi, g00, g11, g22, g33, g03)
+
 class Velocity(object):
     """ object for lab frame velocity as a function of r, only in equatorial plane for now """
     
@@ -63,51 +177,60 @@ class Velocity(object):
                            
         else: 
             raise Exception("veltype %s not recognized in Velocity!"%self.veltype)
-            
+
+        # u_lab dispatch table, bound methods so Velocity stays picklable
+        self._dispatch = {'zamo': self._u_zamo,
+                          'infall': self._u_infall,
+                          'kep': self._u_kep,
+                          'cunningham': self._u_kep,
+                          'subkep': self._u_subkep,
+                          'cunningham_subkep': self._u_subkep,
+                          'general': self._u_general,
+                          'gelles': self._u_gelles,
+                          'simfit': self._u_simfit,
+                          'driftframe': self._u_driftframe}
 
     def u_lab(self, a, r, th=np.pi/2., retqty=False):  
         """Return lab frame contravarient velocity vector"""
-        if self.veltype=='zamo':
-            ucon = u_zamo(a, r) 
-        elif self.veltype=='infall':
-            ucon = u_infall(a, r)                                       
-        elif self.veltype=='kep' or self.veltype=='cunningham':
-            ucon = u_kep(a, r, retrograde=self.retrograde)         
-        elif self.veltype=='subkep' or self.veltype=='cunningham_subkep':
-            ucon = u_subkep(a, r, retrograde=self.retrograde, fac_subkep=self.fac_subkep)  
-        elif self.veltype=='general':
-            ucon = u_general(a, r, retrograde=self.retrograde, fac_subkep=self.fac_subkep,
-                             beta_phi=self.beta_phi, beta_r=self.beta_r) 
-        elif self.veltype=='gelles':
-            ucon = u_gelles(a, r, beta=self.gelles_beta, chi=self.gelles_chi)
-        elif self.veltype=='simfit':                        
-            ucon = u_grmhd_fit(a,r, ell_isco=self.ell_isco, vr_isco=self.vr_isco, p1=self.p1, p2=self.p2, dd=self.dd)    
-        elif self.veltype=='driftframe':
-            ucon = u_driftframe(a, r, bfield=self.bfield, nu_parallel=self.nu_parallel, th=th, 
-                                gammamax = self.gammamax, retqty=retqty)
-
-        else: 
+        u_model = self._dispatch.get(self.veltype)
+        if u_model is None:
             raise Exception("veltype %s not recognized in Velocity.u_lab!"%self.veltype)
             
-        return ucon
+        return u_model(a, r, th, retqty)
+
+    # u_lab dispatch targets, all take (a, r, th, retqty)
+    def _u_zamo(self, a, r, th, retqty):
+        return u_zamo(a, r)
+
+    def _u_infall(self, a, r, th, retqty):
+        return u_infall(a, r)
+
+    def _u_kep(self, a, r, th, retqty):
+        return u_kep(a, r, retrograde=self.retrograde)
+
+    def _u_subkep(self, a, r, th, retqty):
+        return u_subkep(a, r, retrograde=self.retrograde, fac_subkep=self.fac_subkep)
+
+    def _u_general(self, a, r, th, retqty):
+        return u_general(a, r, retrograde=self.retrograde, fac_subkep=self.fac_subkep,
+                         beta_phi=self.beta_phi, beta_r=self.beta_r)
+
+    def _u_gelles(self, a, r, th, retqty):
+        return u_gelles(a, r, beta=self.gelles_beta, chi=self.gelles_chi)
+
+    def _u_simfit(self, a, r, th, retqty):
+        return u_grmhd_fit(a, r, ell_isco=self.ell_isco, vr_isco=self.vr_isco, p1=self.p1, p2=self.p2, dd=self.dd)
+
+    def _u_driftframe(self, a, r, th, retqty):
+        return u_driftframe(a, r, bfield=self.bfield, nu_parallel=self.nu_parallel, th=th,
+                            gammamax=self.gammamax, retqty=retqty)
 
     def u_lab_cov(self, a, r, th=np.pi/2.):
         """Return lab frame covarient velocity vector"""
         (u0, u1, u2, u3) = self.u_lab(a,r,th=th)
 
         # Metric
-        a2 = a**2
-        r2 = r**2
-        cth2 = np.cos(th)**2
-        sth2 = np.sin(th)**2
-        Delta = r2 - 2*r + a2
-        Sigma = r2 + a2 * cth2
-
-        g00 = -(1 - 2*r/Sigma)
-        g11 = Sigma/Delta
-        g22 = Sigma
-        g33 = (r2 + a2 + 2*r*a2*sth2 / Sigma) * sth2
-        g03 = -2*r*a*sth2 / Sigma
+        (_, _, _, _, g00, g11, g22, g33, g03) = _metric_general(a, r, th)
         
         # covariant velocity
         u0_l = g00*u0 + g03*u3
@@ -121,18 +244,8 @@ class Velocity(object):
         """Return tetrads for transformation to orthonormal frame"""
                 
         # Metric
-        a2 = a**2
-        r2 = r**2
-        cth2 = np.cos(th)**2
-        sth2 = np.sin(th)**2
-        Delta = r2 - 2*r + a2
-        Sigma = r2 + a2 * cth2
-
-        g00 = -(1 - 2*r/Sigma)
-        g11 = Sigma/Delta
-        g22 = Sigma
-        g33 = (r2 + a2 + 2*r*a2*sth2 / Sigma) * sth2
-        g03 = -2*r*a*sth2 / Sigma
+        (sth, Delta, _, _, _, g11, g22, _, _) = _metric_general(a, r, th)
+        sth2 = sth*sth
 
         # velocity components
         (u0, u1, u2, u3) = self.u_lab(a,r,th=th)
@@ -169,294 +282,373 @@ class Velocity(object):
         return tetrades
         
                                                                   
-def u_zamo(a, r):
+def u_zamo(a, r, out=None):
     """velocity for zero angular momentum frame"""
-    # checks
-    if not (isinstance(a,float) and (0<=np.abs(a)<1)):
-        raise Exception("|a| should be a float in range [0,1)")
-    if not isinstance(r, np.ndarray): r = np.array([r]).flatten()
-    
-    # Metric
-    th = np.pi/2. # TODO equatorial only
-    Delta = r**2 - 2*r + a**2
-    Sigma = r**2 + a**2 * np.cos(th)**2
-    g00 = -(1-2*r/Sigma)
-    g11 = Sigma/Delta
-    g22 = Sigma
-    g33 = (r**2 + a**2 + 2*r*(a*np.sin(th))**2 / Sigma) * np.sin(th)**2
-    g03 = -2*r*a*np.sin(th)**2 / Sigma
+    # checks, a may be an array of spins
+    (avals, ashape) = _spin_grid(a)
+    if not isinstance(r, np.ndarray): r = np.atleast_1d(r)
 
-    # zamo angular velocity
-    v3 = -g03/g33
+    out = _ucon_buffer(ashape + r.shape, out, r.dtype)
+    out[1] = 0
+    ucon = out.reshape(4, len(avals), r.size)
+    _u_zamo_nb(avals, r.ravel(), ucon[0], ucon[3])
 
-    # Compute u0
-    aa = g00
-    bb = 2*g03*v3
-    cc = g33*v3*v3
-    u0 = np.sqrt(-1./(aa + bb + cc))
+    return out
 
-    # Compute the 4-velocity (contravariant)
-    u3 = u0*v3
-    
-    return (u0, 0, 0, u3)
+@njit(parallel=True, fastmath=FASTMATH, error_model='numpy', cache=True)
+def _u_zamo_nb(avals, r, u0, u3):
+    """numba kernel for u_zamo, fills u0, u3 in place, shape (n_spin, n_r)"""
+    for j in range(len(avals)):
+        a = avals[j]
+        for i in prange(len(r)):
+            rr = np.float64(r[i])
+
+            # Metric, equatorial only
+            (_, _, _, g00, _, _, g33, g03) = _metric_eq(a, rr)
+
+            # zamo angular velocity
+            v3 = -g03/g33
 
-def u_infall(a,r):
+            # Compute the 4-velocity (contravariant)
+            u0[j, i] = np.sqrt(-1./(g00 + 2*g03*v3 + g33*v3*v3))
+            u3[j, i] = u0[j, i]*v3
+
+def u_infall(a, r, out=None):
     """ velocity for geodesic equatorial infall from infinity"""
     
-    # checks
-    if not (isinstance(a,float) and (0<=np.abs(a)<1)):
-        raise Exception("|a| should be a float in range [0,1)")
-    if not isinstance(r, np.ndarray): r = np.array([r]).flatten()
-    
-    Delta = r**2 + a**2 - 2*r
-    Xi = (r**2 + a**2)**2 - Delta*a**2
+    # checks, a may be an array of spins
+    (avals, ashape) = _spin_grid(a)
+    if not isinstance(r, np.ndarray): r = np.atleast_1d(r)
 
-    u0 = Xi/(r**2 * Delta)
-    u1 = -np.sqrt(2*r*(r**2 + a**2))/(r**2)
-    u3 = 2*a/(r*Delta)
-    
-    return (u0, u1, 0, u3)
-        
-    
-def u_kep(a, r, retrograde=False):
+    out = _ucon_buffer(ashape + r.shape, out, r.dtype)
+    ucon = out.reshape(4, len(avals), r.size)
+    _u_infall_nb(avals, r.ravel(), ucon[0], ucon[1], ucon[3])
+
+    return out
+
+@njit(parallel=True, fastmath=FASTMATH, error_model='numpy', cache=True)
+def _u_infall_nb(avals, r, u0, u1, u3):
+    """numba kernel for u_infall, fills u0, u1, u3 in place, shape (n_spin, n_r)"""
+    for j in range(len(avals)):
+        a = avals[j]
+        a2 = a*a
+        for i in prange(len(r)):
+            rr = np.float64(r[i])
+            r2 = rr*rr
+            (Delta, _, Xi, _, _, _, _, _) = _metric_eq(a, rr)
+
+            u0[j, i] = Xi/(r2 * Delta)
+            u1[j, i] = -np.sqrt(2*rr*(r2 + a2))/r2
+            u3[j, i] = 2*a/(rr*Delta)
+
+def u_kep(a, r, retrograde=False, out=None):
     """Cunningham velocity for material on keplerian orbits and infalling inside isco"""
-    # checks
-    if not (isinstance(a,float) and (0<=np.abs(a)<1)):
-        raise Exception("|a| should be a float in range [0,1)")
-    if not isinstance(r, np.ndarray): r = np.array([r]).flatten()
+    # checks, a may be an array of spins
+    (avals, ashape) = _spin_grid(a)
+    if not isinstance(r, np.ndarray): r = np.atleast_1d(r)
     
     if retrograde:
         s = -1
     else:
         s = 1
-        
+
     # isco radius
-    z1 = 1 + np.cbrt(1-a**2)*(np.cbrt(1+a) + np.cbrt(1-a))
-    z2 = np.sqrt(3*a**2 + z1**2)
-    ri = 3 + z2 - s*np.sqrt((3-z1)*(3+z1+2*z2))
-    #print("r_isco: ",ri)
-    
-    u0 = np.zeros(r.shape)
-    u1 = np.zeros(r.shape)
-    u3 = np.zeros(r.shape)
-    
-    iscomask = (r >= ri)
-    spin = np.abs(a)
-    asign = np.sign(a)    
-    # outside isco
-    if np.any(iscomask):
-        rr = r[iscomask]
-        
-        Omega = asign*s / (rr**1.5 + s*spin)
-        u0[iscomask] = (rr**1.5 + s*spin) / np.sqrt(rr**3 - 3*rr**2 + 2*s*spin*rr**1.5)
-        u3[iscomask] = Omega*u0[iscomask]
+    rivals = np.array([_isco_radius(aj, s) for aj in avals])
 
-    
-    # inside isco
-    if np.any(~iscomask):
-        rr = r[~iscomask]
+    out = _ucon_buffer(ashape + r.shape, out, r.dtype)
+    ucon = out.reshape(4, len(avals), r.size)
+    _u_kep_nb(avals, r.ravel(), s, rivals, ucon[0], ucon[1], ucon[3])
+
+    return out
+
+@njit(parallel=True, fastmath=FASTMATH, error_model='numpy', cache=True)
+def _u_kep_nb(avals, r, s, rivals, u0, u1, u3):
+    """numba kernel for u_kep, fills u0, u1, u3 in place, shape (n_spin, n_r)"""
+    for j in range(len(avals)):
+        a = avals[j]
+        ri = rivals[j]
+        a2 = a*a
+        spin = np.abs(a)
+        asign = np.sign(a)
 
-        # preliminaries
-        Delta = (rr**2 - 2*rr + a**2)
-        
         # isco conserved quantities
-        ell_i = s*asign*(ri**2  + a**2 - s*2*spin*np.sqrt(ri))/(ri**1.5 - 2*np.sqrt(ri) + s*spin)       
+        sqrt_ri = np.sqrt(ri)
+        ell_i = s*asign*(ri*ri + a2 - s*2*spin*sqrt_ri)/(ri*sqrt_ri - 2*sqrt_ri + s*spin)
         gam_i = np.sqrt(1 - 2./(3.*ri)) # nice expression only for isco, prograde or retrograde
- 
-        # contravarient vel
-        H = (2*rr - a*ell_i)/Delta 
-        chi = 1/(1 + (2/rr)*(1+H))
-        
-        u0[~iscomask] = gam_i*(1 + (2/rr)*(1 + H))
-        u1[~iscomask] = -np.sqrt(2./(3*ri))*(ri/rr - 1)**1.5
-        u3[~iscomask] = gam_i*(ell_i + a*H)/(rr**2)
-        
-    return (u0, u1, 0, u3)
-
-def u_subkep(a, r, fac_subkep=1, retrograde=False):
+        u1_i = -np.sqrt(2./(3*ri))
+
+        for i in prange(len(r)):
+            rr = np.float64(r[i])
+            r2 = rr*rr
+            r15 = rr*np.sqrt(rr)
+
+            # outside isco
+            Omega = asign*s / (r15 + s*spin)
+            u0_out = (r15 + s*spin) / np.sqrt(r2*rr - 3*r2 + 2*s*spin*r15)
+            u3_out = Omega*u0_out
+
+            # inside isco, clamped so the unused branch is harmless outside isco
+            Delta = r2 - 2*rr + a2
+            H = (2*rr - a*ell_i)/Delta
+            x = max(ri/rr - 1, 0.)
+
+            u0_in = gam_i*(rr + 2*(1 + H))/rr
+            u1_in = u1_i*x*np.sqrt(x)
+            u3_in = gam_i*(ell_i + a*H)/r2
+
+            # evaluate both branches and select, so the loop has no jumps
+            outside = rr >= ri
+            u0[j, i] = u0_out if outside else u0_in
+            u1[j, i] = 0. if outside else u1_in
+            u3[j, i] = u3_out if outside else u3_in
+
+def u_subkep(a, r, fac_subkep=1, retrograde=False, out=None):
     """(sub) keplerian velocty and infalling inside isco"""
-    # checks
-    if not (isinstance(a,float) and (0<=np.abs(a)<1)):
-        raise Exception("|a| should be a float in range [0,1)")
+    # checks, a may be an array of spins
+    (avals, ashape) = _spin_grid(a)
     if not (0<=fac_subkep<=1):
         raise Exception("fac_subkep should be in the range [0,1]")
-    if not isinstance(r, np.ndarray): r = np.array([r]).flatten()
+    if not isinstance(r, np.ndarray): r = np.atleast_1d(r)
     
     if retrograde:
         s = -1
     else:
         s = 1
-        
-    # isco radius
-    z1 = 1 + np.cbrt(1-a**2)*(np.cbrt(1+a) + np.cbrt(1-a))
-    z2 = np.sqrt(3*a**2 + z1**2)
-    ri = 3 + z2 - s*np.sqrt((3-z1)*(3+z1+2*z2))
-    #print("r_isco:", ri)
-    
 
-    u0 = np.zeros(r.shape)
-    u1 = np.zeros(r.shape)
-    u3 = np.zeros(r.shape)
-
-    iscomask = (r >= ri)
-    spin = np.abs(a)
-    asign = np.sign(a)
-    # outside isco)
-    if np.any(iscomask):
-        rr = r[iscomask]
-            
-        # preliminaries       
-        Delta = (rr**2 - 2*rr + a**2)
-        Xi = (rr**2 + a**2)**2 - Delta*a**2
-        
-        # conserved quantities
-        ell = asign*s * (rr**2 + spin**2 - s*2*spin*np.sqrt(rr))/(rr**1.5 - 2*np.sqrt(rr) + s*spin)
-        ell *= fac_subkep
-        gam = np.sqrt(Delta/(Xi/rr**2 - 4*a*ell/rr - (1-2/rr)*ell**2))
-        
-        # contravarient vel
-        H = (2*rr - a*ell)/Delta
-        chi = 1 / (1 + (2/rr)*(1+H))
-        Omega = (chi/rr**2)*(ell + a*H)
-        
-        u0[iscomask] = gam/chi
-        u3[iscomask] = (gam/chi)*Omega
-        
-    # inside isco
-    if np.any(~iscomask):
-        rr = r[~iscomask]
+    # isco radius and conserved quantities
+    (rivals, ell_ivals, gam_ivals) = _isco_params(avals, s, fac_subkep)
+
+    out = _ucon_buffer(ashape + r.shape, out, r.dtype)
+    ucon = out.reshape(4, len(avals), r.size)
+    _u_subkep_nb(avals, r.ravel(), s, rivals, fac_subkep, ell_ivals, gam_ivals, ucon[0], ucon[1], ucon[3])
+
+    return out
+
+@njit(parallel=True, fastmath=FASTMATH, error_model='numpy', cache=True)
+def _u_subkep_nb(avals, r, s, rivals, fac_subkep, ell_ivals, gam_ivals, u0, u1, u3):
+    """numba kernel for u_subkep, fills u0, u1, u3 in place, shape (n_spin, n_r)"""
+    for j in range(len(avals)):
+        a = avals[j]
+        ri = rivals[j]
+        ell_i = ell_ivals[j]
+        gam_i = gam_ivals[j]
+        a2 = a*a
+        spin = np.abs(a)
+        asign = np.sign(a)
+
+        for i in prange(len(r)):
+            rr = np.float64(r[i])
+
+            # preliminaries, shared by both branches
+            sqrt_r = np.sqrt(rr)
+            r15 = rr*sqrt_r
+            r2 = rr*rr
+            (Delta, _, Xi, _, _, _, _, _) = _metric_eq(a, rr)
+
+            # outside isco
+            ell = asign*s * (r2 + a2 - s*2*spin*sqrt_r)/(r15 - 2*sqrt_r + s*spin)
+            ell *= fac_subkep
+            gam = np.sqrt(Delta/(Xi/r2 - 4*a*ell/rr - (1-2/rr)*ell*ell))
+
+            H = (2*rr - a*ell)/Delta
+            chi = rr / (rr + 2*(1+H))
+            Omega = (chi/r2)*(ell + a*H)
+
+            u0_out = gam/chi
+            u3_out = (gam/chi)*Omega
+
+            # inside isco
+            H = (2*rr - a*ell_i)/Delta
+            chi = rr / (rr + 2*(1+H))
+            Omega = (chi/r2)*(ell_i + a*H)
+            nu = (rr/Delta)*np.sqrt(Xi/r2 - 4*a*ell_i/rr - (1-2/rr)*ell_i*ell_i - Delta/(gam_i*gam_i))
+
+            u0_in = gam_i/chi
+            u1_in = -gam_i*(Delta/r2)*nu
+            u3_in = (gam_i/chi)*Omega
+
+            # evaluate both branches and select, so the loop has no jumps
+            outside = rr >= ri
+            u0[j, i] = u0_out if outside else u0_in
+            u1[j, i] = 0. if outside else u1_in
+            u3[j, i] = u3_out if outside else u3_in
+
+def u_gelles(a, r, beta=0.3, chi=-150*(np.pi/180.), out=None):
+    """velocity prescription from Gelles+2021, Eq A4"""
+    # checks, a may be an array of spins
+    (avals, ashape) = _spin_grid(a)
+    if not isinstance(r, np.ndarray): r = np.atleast_1d(r)
 
-        # preliminaries
-        Delta = (rr**2 - 2*rr + a**2)
-        Xi = (rr**2 + a**2)**2 - Delta*a**2
-        
-        # isco conserved quantities
-        Delta_i = (ri**2 - 2*ri + a**2)
-        Xi_i = (ri**2 + a**2)**2 - Delta_i*a**2
-                
-        ell_i = asign*s * (ri**2  + spin**2 - s*2*spin*np.sqrt(ri))/(ri**1.5 - 2*np.sqrt(ri) + s*spin) 
-        ell_i *= fac_subkep  
-        gam_i = np.sqrt(Delta_i/(Xi_i/ri**2 - 4*a*ell_i/ri - (1-2/ri)*ell_i**2))
-        
-        # contravarient vel
-        H = (2*rr - a*ell_i)/Delta 
-        chi = 1 / (1 + (2/rr)*(1+H))
-        Omega = (chi/rr**2)*(ell_i + a*H)
-        nu = (rr/Delta)*np.sqrt(Xi/rr**2 - 4*a*ell_i/rr - (1-2/rr)*ell_i**2 - Delta/gam_i**2)
+    out = _ucon_buffer(ashape + r.shape, out, r.dtype)
+    ucon = out.reshape(4, len(avals), r.size)
+    _u_gelles_nb(avals, r.ravel(), beta, chi, ucon[0], ucon[1], ucon[3])
 
-                
-        u0[~iscomask] = gam_i/chi
-        u1[~iscomask] = -gam_i*(Delta/rr**2)*nu
-        u3[~iscomask] = (gam_i/chi)*Omega
+    return out
 
-    return (u0, u1, 0, u3)
-  
-def u_gelles(a, r, beta=0.3, chi=-150*(np.pi/180.)):
-    """velocity prescription from Gelles+2021, Eq A4"""
-    # checks
-    if not (isinstance(a,float) and (0<=np.abs(a)<1)):
-        raise Exception("|a| should be a float in range [0,1)")
-    if not isinstance(r, np.ndarray): r = np.array([r]).flatten()
-    
-    # Metric
-    a2 = a**2
-    r2 = r**2
-    th = np.pi/2. # equatorial only
-    cth2 = np.cos(th)**2
-    sth2 = np.sin(th)**2
-    Delta = r2 - 2*r + a2
-    Sigma = r2 + a2 * cth2
-    Xi = (r2 + a2)**2 - Delta*a2*sth2
-    omegaz = 2*a*r/Xi
-    
-    gamma = 1/np.sqrt(1-beta**2)
+@njit(parallel=True, fastmath=FASTMATH, error_model='numpy', cache=True)
+def _u_gelles_nb(avals, r, beta, chi, u0, u1, u3):
+    """numba kernel for u_gelles, fills u0, u1, u3 in place, shape (n_spin, n_r)"""
+    gamma = 1/np.sqrt(1-beta*beta)
     coschi = np.cos(chi)
     sinchi = np.sin(chi)
-    
-    u0 = (gamma/r)*np.sqrt(Xi/Delta)
-    u1 = (beta*gamma*coschi/r)*np.sqrt(Delta)
-    u3 = (gamma*omegaz/r)*np.sqrt(Xi/Delta) + (r*beta*gamma*sinchi)/np.sqrt(Xi)
 
-    return (u0, u1, 0, u3)            
-          
-def u_grmhd_fit(a, r, ell_isco=ELLISCO, vr_isco=VRISCO, p1=P1, p2=P2, dd=DD):
+    for j in range(len(avals)):
+        a = avals[j]
+        for i in prange(len(r)):
+            rr = np.float64(r[i])
+
+            # Metric, equatorial only
+            (Delta, _, Xi, _, _, _, _, _) = _metric_eq(a, rr)
+            omegaz = 2*a*rr/Xi
+
+            u0[j, i] = (gamma/rr)*np.sqrt(Xi/Delta)
+            u1[j, i] = (beta*gamma*coschi/rr)*np.sqrt(Delta)
+            u3[j, i] = (gamma*omegaz/rr)*np.sqrt(Xi/Delta) + (rr*beta*gamma*sinchi)/np.sqrt(Xi)
+
+def u_grmhd_fit(a, r, ell_isco=ELLISCO, vr_isco=VRISCO, p1=P1, p2=P2, dd=DD, out=None):
     """velocity for power laws fit to grmhd ell, conserved inside isco
        should be timelike throughout equatorial plane
        might not work for all spins
     """
-    # checks
-    if not (isinstance(a,float) and (0<=np.abs(a)<1)):
-        raise Exception("|a| should be a float in range [0,1)")
-    if not isinstance(r, np.ndarray): r = np.array([r]).flatten()
+    # checks, a may be an array of spins
+    (avals, ashape) = _spin_grid(a)
+    if not isinstance(r, np.ndarray): r = np.atleast_1d(r)
 
     # isco radius
-    rh = 1 + np.sqrt(1-a**2)
-    z1 = 1 + np.cbrt(1-a**2)*(np.cbrt(1+a) + np.cbrt(1-a))
-    z2 = np.sqrt(3*a**2 + z1**2)
-    r_isco = 3 + z2 - np.sqrt((3-z1)*(3+z1+2*z2))
-
-    # Metric
-    a2 = a**2
-    r2 = r**2
-    th = np.pi/2. # TODO equatorial only
-    cth2 = np.cos(th)**2
-    sth2 = np.sin(th)**2
-    Delta = r2 - 2*r + a2
-    Sigma = r2 + a2 * cth2
-
-    g00_up = -(r2 + a2 + 2*r*a2*sth2/Sigma) / Delta
-    g11_up = Delta/Sigma
-    g22_up = 1./Sigma
-    g33_up = (Delta - a2*sth2)/(Sigma*Delta*sth2)
-    g03_up = -(2*r*a)/(Sigma*Delta)
-
-    # Fitting function should work down to the horizon
-    # u_phi/u_t fitting function
-    ell = ell_isco*(r/r_isco)**.5 # defined positive
-    vr = -vr_isco*((r/r_isco)**(-p1)) * (0.5*(1+(r/r_isco)**(1/dd)))**((p1-p2)*dd)
-    gam = np.sqrt(-1./(g00_up + g11_up*vr*vr + g33_up*ell*ell - 2*g03_up*ell))
-
-    # compute u_t
-    u_0 = -gam
-    u_1 = vr*gam
-    u_3 = ell*gam
-
-    # raise indices
-    u0 = g00_up*u_0 + g03_up*u_3
-    u1 = g11_up*u_1
-    u3 = g33_up*u_3 + g03_up*u_0
-
-    return (u0, u1, 0, u3)       
-    
-def u_general(a, r, fac_subkep=1, beta_phi=1, beta_r=1, retrograde=False):
+    r_iscovals = np.array([_isco_radius(aj, 1) for aj in avals])
+
+    out = _ucon_buffer(ashape + r.shape, out, r.dtype)
+    ucon = out.reshape(4, len(avals), r.size)
+    _u_grmhd_fit_nb(avals, r.ravel(), r_iscovals, ell_isco, vr_isco, p1, p2, dd, ucon[0], ucon[1], ucon[3])
+
+    return out
+
+@njit(parallel=True, fastmath=FASTMATH, error_model='numpy', cache=True)
+def _u_grmhd_fit_nb(avals, r, r_iscovals, ell_isco, vr_isco, p1, p2, dd, u0, u1, u3):
+    """numba kernel for u_grmhd_fit, fills u0, u1, u3 in place, shape (n_spin, n_r)"""
+    for j in range(len(avals)):
+        a = avals[j]
+        r_isco = r_iscovals[j]
+        for i in prange(len(r)):
+            rr = np.float64(r[i])
+
+            # Metric, equatorial only
+            (Delta, _, _, g00, g11, _, g33, g03) = _metric_eq(a, rr)
+
+            # inverse metric, g03^2 - g00*g33 = Delta on the equator
+            g00_up = -g33/Delta
+            g11_up = 1/g11
+            g33_up = -g00/Delta
+            g03_up = g03/Delta
+
+            # Fitting function should work down to the horizon
+            # u_phi/u_t fitting function
+            ell = ell_isco*np.sqrt(rr/r_isco) # defined positive
+            vr = -vr_isco*((rr/r_isco)**(-p1)) * (0.5*(1+(rr/r_isco)**(1/dd)))**((p1-p2)*dd)
+            gam = np.sqrt(-1./(g00_up + g11_up*vr*vr + g33_up*ell*ell - 2*g03_up*ell))
+
+            # compute u_t
+            u_0 = -gam
+            u_1 = vr*gam
+            u_3 = ell*gam
+
+            # raise indices
+            u0[j, i] = g00_up*u_0 + g03_up*u_3
+            u1[j, i] = g11_up*u_1
+            u3[j, i] = g33_up*u_3 + g03_up*u_0
+
+def u_general(a, r, fac_subkep=1, beta_phi=1, beta_r=1, retrograde=False, out=None):
     """general velocity model from AART paper, keplerian by default""" 
-    # checks
-    if not (isinstance(a,float) and (0<=np.abs(a)<1)):
-        raise Exception("|a| should be a float in range [0,1)")
+    # checks, a may be an array of spins
+    (avals, ashape) = _spin_grid(a)
     if not (0<=fac_subkep<=1):
         raise Exception("fac_subkep should be in the range [0,1]")
     if not (0<=beta_phi<=1):
         raise Exception("beta_phi should be in the range [0,1]")        
     if not (0<=beta_r<=1):
         raise Exception("beta_r should be in the range [0,1]")        
-    if not isinstance(r, np.ndarray): r = np.array([r]).flatten()
-    
-    Delta = r**2 + a**2 - 2*r
-    
-    (u0_infall, u1_infall, _, u3_infall) = u_infall(a,r)
-    Omega_infall = u3_infall/u0_infall # 2ar/Xi
-    (u0_subkep, u1_subkep, _, u3_subkep) = u_subkep(a,r,retrograde=retrograde,fac_subkep=fac_subkep)
-    Omega_subkep = u3_subkep/u0_subkep
-    
-    u1 = u1_subkep + (1-beta_r)*(u1_infall - u1_subkep)
-    Omega = Omega_subkep + (1-beta_phi)*(Omega_infall - Omega_subkep)
-    
-    u0  = np.sqrt(1 + (r**2) * (u1**2) / Delta) #???
-    u0 /= np.sqrt(1 - (r**2 + a**2)*Omega**2 - (2/r)*(1 - a*Omega)**2)
+    if not isinstance(r, np.ndarray): r = np.atleast_1d(r)
 
-    u3 = u0*Omega
-    
-    return (u0, u1, 0, u3) 
+    if retrograde:
+        s = -1
+    else:
+        s = 1
+
+    # isco radius and conserved quantities
+    (rivals, ell_ivals, gam_ivals) = _isco_params(avals, s, fac_subkep)
+
+    out = _ucon_buffer(ashape + r.shape, out, r.dtype)
+    ucon = out.reshape(4, len(avals), r.size)
+    _u_general_nb(avals, r.ravel(), s, rivals, fac_subkep, ell_ivals, gam_ivals, beta_phi, beta_r, ucon[0], ucon[1], ucon[3])
+
+    return out
+
+@njit(parallel=True, fastmath=FASTMATH, error_model='numpy', cache=True)
+def _u_general_nb(avals, r, s, rivals, fac_subkep, ell_ivals, gam_ivals, beta_phi, beta_r, u0, u1, u3):
+    """numba kernel for u_general, fills u0, u1, u3 in place, shape (n_spin, n_r)"""
+    for j in range(len(avals)):
+        a = avals[j]
+        ri = rivals[j]
+        ell_i = ell_ivals[j]
+        gam_i = gam_ivals[j]
+        for i in prange(len(r)):
+            (u0[j, i], u1[j, i], u3[j, i]) = _u_general_point(a, np.float64(r[i]), s, ri, fac_subkep, ell_i, gam_i,
+                                                              beta_phi, beta_r)
+
+@njit(fastmath=FASTMATH, error_model='numpy', cache=True, inline='always')
+def _u_general_point(a, rr, s, ri, fac_subkep, ell_i, gam_i, beta_phi, beta_r):
+    """u_general at a single radius, returns (u0, u1, u3)
+       the subkep and infall models are inlined so the isco radius, Delta and Xi
+       are computed once and Omega is never recovered from u3/u0
+    """
+    a2 = a*a
+    spin = np.abs(a)
+    asign = np.sign(a)
+
+    # preliminaries, shared by all branches
+    sqrt_r = np.sqrt(rr)
+    r15 = rr*sqrt_r
+    r2 = rr*rr
+    (Delta, _, Xi, _, _, _, _, _) = _metric_eq(a, rr)
+
+    # subkeplerian: outside isco
+    ell = asign*s * (r2 + a2 - s*2*spin*sqrt_r)/(r15 - 2*sqrt_r + s*spin)
+    ell *= fac_subkep
+
+    H = (2*rr - a*ell)/Delta
+    chi = rr / (rr + 2*(1+H))
+    Omega_out = (chi/r2)*(ell + a*H)
+
+    # subkeplerian: inside isco
+    H = (2*rr - a*ell_i)/Delta
+    chi = rr / (rr + 2*(1+H))
+    Omega_in = (chi/r2)*(ell_i + a*H)
+    nu = (rr/Delta)*np.sqrt(Xi/r2 - 4*a*ell_i/rr - (1-2/rr)*ell_i*ell_i - Delta/(gam_i*gam_i))
+    u1_in = -gam_i*(Delta/r2)*nu
+
+    # evaluate both branches and select, so the loop has no jumps
+    outside = rr >= ri
+    Omega_subkep = Omega_out if outside else Omega_in
+    u1_subkep = 0. if outside else u1_in
+
+    # infall
+    Omega_infall = 2*a*rr/Xi
+    u1_infall = -np.sqrt(2*rr*(r2 + a2))/r2
+
+    # blend
+    return _omega_blend(rr, a, Delta, u1_subkep, u1_infall, Omega_subkep, Omega_infall, beta_r, beta_phi)
+
+@njit(fastmath=FASTMATH, error_model='numpy', cache=True, inline='always')
+def _omega_blend(r, a, Delta, u1_sub, u1_inf, Omega_sub, Omega_inf, beta_r, beta_phi):
+    """blend the subkeplerian and infall u1, Omega at a single radius, returns (u0, u1, u3)"""
+    u1 = u1_sub + (1-beta_r)*(u1_inf - u1_sub)
+    Omega = Omega_sub + (1-beta_phi)*(Omega_inf - Omega_sub)
+
+    r2 = r*r
+    u0 = np.sqrt(1 + r2*u1*u1/Delta) #???
+    u0 /= np.sqrt(1 - (r2 + a*a)*Omega*Omega - (2/r)*(1 - a*Omega)*(1 - a*Omega))
+
+    return (u0, u1, u0*Omega)
 
 #get boost parameter that conserves energy in co-rotating frame
 def getnu_cons(bf_here, r, theta, r0, theta0, Omegaf, spin, M):
@@ -508,25 +700,12 @@ def u_driftframe(a,r, bfield=BFIELD_DEFAULT, nu_parallel=0, th=np.pi/2, gammamax
         raise Exception("|a| should be a float in range [0,1)")
     if np.any(np.logical_or(nu_parallel>1 , nu_parallel<-1)):
         raise Exception("nu_parallel should be in the range (-1,1)")
-    if not isinstance(r, np.ndarray): r = np.array([r]).flatten()
+    if not isinstance(r, np.ndarray): r = np.atleast_1d(r)
     
     # metric 
-    a2 = a**2
-    r2 = r**2
-    cth2 = np.cos(th)**2
-    sth2 = np.sin(th)**2
-    
-    Delta = r2 - 2*r + a2
-    Sigma = r2 + a2 * cth2
-    Xi = (r2 + a2)**2 - Delta*a2*sth2
+    (sth, Delta, Sigma, Xi, g00, g11, g22, g33, g03) = _metric_general(a, r, th)
     omegaz = 2*a*r/Xi
-    gdet = Sigma*np.sin(th)
-    
-    g00 = -(1-2*r/Sigma)
-    g11 = Sigma/Delta
-    g22 = Sigma
-    g33 = Xi*sth2/Sigma
-    g03 = -2*r*a*np.sin(th)**2 / Sigma
+    gdet = Sigma*sth
     
     # lapse and shift   
     alpha2 = Delta*Sigma/Xi
@@ -538,34 +717,27 @@ def u_driftframe(a,r, bfield=BFIELD_DEFAULT, nu_parallel=0, th=np.pi/2, gammamax
     # e and b field
     omegaf = bfield.omega_field(a,r,th=th)
     (B1,B2,B3) = bfield.bfield_lab(a,r,th=th)
-    #(E1,E2,E3) = bfield.efield_lab(a,r,th=th) #unnecessary
 
-    E1 = (omegaf-omegaz)*Xi*np.sin(th)*B2/Sigma
-    E2 = -(omegaf-omegaz)*Xi*np.sin(th)*B1/(Sigma*Delta)
+    # degenerate E field from omegaf and B, so bfield.efield_lab is not needed
+    E1 = (omegaf-omegaz)*Xi*sth*B2/Sigma
+    E2 = -(omegaf-omegaz)*Xi*sth*B1/(Sigma*Delta)
     E3 = 0            
                 
     Bsq = g11*B1*B1 + g22*B2*B2 + g33*B3*B3
     Esq = g11*E1*E1 + g22*E2*E2 + g33*E3*E3    
     
-    B1_cov = g11*B1
-    B2_cov = g22*B2
-    B3_cov = g33*B3
-    
-    E1_cov = g11*E1
-    E2_cov = g22*E2
-    E3_cov = g33*E3
-
-        
     # perp velocity in the lnrf, vtilde_perp
-    vperp1 = (alpha/(Bsq*gdet))*(E2_cov*B3_cov - B2_cov*E3_cov) 
-    vperp2 = (alpha/(Bsq*gdet))*(E3_cov*B1_cov - B3_cov*E1_cov) 
-    vperp3 = (alpha/(Bsq*gdet))*(E1_cov*B2_cov - B1_cov*E2_cov) 
+    (vperp1, vperp2, vperp3) = _drift_perp(alpha, Bsq, gdet, g11, g22, g33, B1, B2, B3, E1, E2, E3)
    
     # parallel velocity in the lnrf, vtilde_perp   
     vpar_max = np.sqrt(1 - Esq/Bsq)
-    vpar1 = nu_parallel*vpar_max*B1/np.sqrt(Bsq)
-    vpar2 = nu_parallel*vpar_max*B2/np.sqrt(Bsq)
-    vpar3 = nu_parallel*vpar_max*B3/np.sqrt(Bsq)
+    # keep the division by sqrt_B, with complex fields (bz_para) a reciprocal flips the sign
+    # of zero imaginary parts and so the branch of gamma where vsq > 1
+    sqrt_B = np.sqrt(Bsq)
+    vpar_fac = nu_parallel*vpar_max
+    vpar1 = vpar_fac*B1/sqrt_B
+    vpar2 = vpar_fac*B2/sqrt_B
+    vpar3 = vpar_fac*B3/sqrt_B
     
     # convert to four-velocity
     v1 = vperp1 + vpar1
@@ -573,7 +745,7 @@ def u_driftframe(a,r, bfield=BFIELD_DEFAULT, nu_parallel=0, th=np.pi/2, gammamax
     v3 = vperp3 + vpar3
 
     if retbunit: #returns gammaperp and raised unit vector along B (useful for FF computations)
-        return (alpha, v3, 1/vpar_max, B3/np.sqrt(Bsq))
+        return (alpha, v3, 1/vpar_max, B3/sqrt_B)
     
     vsq = g11*v1*v1 + g22*v2*v2 + g33*v3*v3
     gamma = 1./np.sqrt(1-vsq)
@@ -590,10 +762,11 @@ def u_driftframe(a,r, bfield=BFIELD_DEFAULT, nu_parallel=0, th=np.pi/2, gammamax
             argdiv = np.argmin(np.abs(np.nan_to_num(gammaeff, nan=np.inf)))
             gammaeff0 = gammaeff*gamma[argdiv]/gammaeff[argdiv] #ensure gamma>1 always
         
-        vsqeff = 1-1/gammaeff0**2 #convert 
-        v1new  = v1*np.sqrt(vsqeff/vsq)
-        v2new = v2*np.sqrt(vsqeff/vsq)
-        v3new = v3*np.sqrt(vsqeff/vsq)
+        vsqeff = 1-1/(gammaeff0*gammaeff0) #convert 
+        vfac = np.sqrt(vsqeff/vsq)
+        v1new  = v1*vfac
+        v2new = v2*vfac
+        v3new = v3*vfac
 
         v1 = v1new
         v2 = v2new
@@ -609,3 +782,36 @@ def u_driftframe(a,r, bfield=BFIELD_DEFAULT, nu_parallel=0, th=np.pi/2, gammamax
         return (gamma, g11*v1, g22*v2, g33*v3)
     
     return (u0, u1, u2, u3)
+
+def _drift_perp(alpha, Bsq, gdet, g11, g22, g33, B1, B2, B3, E1, E2, E3):
+    """perp drift velocity in the lnrf, (vperp1, vperp2, vperp3) as one (3,...) array
+       inputs are broadcast to a common shape and dtype (B may be complex or scalar)
+    """
+    fields = (alpha, Bsq, gdet, g11, g22, g33, B1, B2, B3, E1, E2, E3)
+    shape = np.broadcast(*fields).shape
+    dtype = np.result_type(*fields)
+    fields = [np.broadcast_to(np.asarray(x, dtype=dtype), shape).ravel() for x in fields]
+
+    vperp = np.empty((3,) + shape, dtype=dtype)
+    vflat = vperp.reshape(3, -1)
+    _drift_perp_nb(*fields, vflat[0], vflat[1], vflat[2])
+    return vperp
+
+@njit(parallel=True, fastmath=FASTMATH, error_model='numpy', cache=True)
+def _drift_perp_nb(alpha, Bsq, gdet, g11, g22, g33, B1, B2, B3, E1, E2, E3, vperp1, vperp2, vperp3):
+    """numba kernel for the E x B drift velocity, fills vperp1, vperp2, vperp3 in place"""
+    for i in prange(len(alpha)):
+        # lower B and E
+        B1_cov = g11[i]*B1[i]
+        B2_cov = g22[i]*B2[i]
+        B3_cov = g33[i]*B3[i]
+
+        E1_cov = g11[i]*E1[i]
+        E2_cov = g22[i]*E2[i]
+        E3_cov = g33[i]*E3[i]
+
+        # cross product
+        fac = alpha[i]/(Bsq[i]*gdet[i])
+        vperp1[i] = fac*(E2_cov*B3_cov - B2_cov*E3_cov)
+        vperp2[i] = fac*(E3_cov*B1_cov - B3_cov*E1_cov)
+        vperp3[i] = fac*(E1_cov*B2_cov - B1_cov*E2_cov)
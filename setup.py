@@ -24,7 +24,8 @@ if __name__ == "__main__":
                             "tqdm",
                             "matplotlib",
                             "ehtim",
-                            "h5py"
+                            "h5py",
+                            "numba"
                           ],
           classifiers=[
             'Development Status :: 3 - Alpha',     